@@ -7,15 +7,21 @@ only list of values (int, float, bool, str). "." cannot be used inside a key nam
 Also some specific keys are used by this library in the root level. See README.md about this.
 """
 
-import copy
+import functools
 import os
 import pathlib
 import re
-from typing import Set, cast, Dict, List, Union
+import sys
+from typing import Iterator, Optional, Set, Tuple, cast, Dict, List, Union
 import warnings
 
 import yaml
 
+try:  # Use LibYAML bindings if available (much faster)
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader  # type: ignore
+
 
 Value = Union[bool, int, float, str]
 
@@ -32,7 +38,9 @@ def load_config(config_file: Union[str, pathlib.Path]) -> Config:
         Config: The loaded configuration. Parsing is not performed at loading time.
     """
     path = pathlib.Path(config_file)
-    cfg: Config = yaml.safe_load(path.read_text(encoding="utf-8"))
+    resolved_path = path.resolve()
+    stat = resolved_path.stat()
+    cfg = cast(Config, _clone(_read_config(str(resolved_path), stat.st_mtime_ns, stat.st_size)))
 
     try:
         defaults = cast(Union[str, List[str]], cfg.pop("__default__"))
@@ -59,6 +67,16 @@ def load_config(config_file: Union[str, pathlib.Path]) -> Config:
     return cfg
 
 
+@functools.lru_cache(maxsize=128)
+def _read_config(path: str, mtime_ns: int, size: int) -> Config:  # pylint: disable=unused-argument
+    """Read and load a yaml file. Cached as the same file can be inherited several times.
+
+    The modification time and size of the file are only given to invalidate the cache when the file changes.
+    The returned config is shared between calls and should not be modified.
+    """
+    return yaml.load(pathlib.Path(path).read_bytes(), Loader=SafeLoader)
+
+
 def save_config(cfg: Config, config_file: Union[str, pathlib.Path]) -> None:
     """Save the configuration
 
@@ -67,7 +85,7 @@ def save_config(cfg: Config, config_file: Union[str, pathlib.Path]) -> None:
         config_file (Union[str, Path]): Save to this destination
     """
     path = pathlib.Path(config_file)
-    path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+    path.write_text(yaml.dump(cfg, Dumper=SafeDumper), encoding="utf-8")
 
 
 def config_flatten(cfg: Config) -> Dict[str, Union[Value, List[Value]]]:
@@ -98,26 +116,38 @@ def config_flatten(cfg: Config) -> Dict[str, Union[Value, List[Value]]]:
         Config: The flattened config
     """
     flattened: Dict[str, Union[Value, List[Value]]] = {}
-    _flatten(cfg, flattened)
+    for true_key, _, _, value in _iter_values(cfg):
+        if true_key in flattened:
+            raise ValueError(f"{true_key} is already set. Should not override it")
+        flattened[sys.intern(true_key)] = value  # Interned keys are compared by identity
 
     return flattened
 
 
-def _flatten(cfg: Config, flattened: Dict[str, Union[Value, List[Value]]], prefix: str = "") -> None:
-    for key, value in cfg.items():
-        true_key = f"{prefix}.{key}"
-        if not prefix:
-            true_key = key
+def _iter_values(cfg: Config) -> Iterator[Tuple[str, Config, str, Union[Value, List[Value]]]]:
+    """Iterate over all the values (not dict) of a config in depth first order
 
-        # If dict: continue with the new prefix
-        if isinstance(value, dict):
-            _flatten(value, flattened, true_key)
-            continue
-
-        # Else: Let's register the value
-        if true_key in flattened:
-            raise ValueError(f"{true_key} is already set. Should not override it")
-        flattened[true_key] = value
+    Yields:
+        str: Full key of the value ("." separated)
+        Config: Sub config that holds the value
+        str: Key of the value in this sub config
+        Union[Value, List[Value]]: The value
+    """
+    # Iterative depth first search. Each level keeps its prefix, its dict and an iterator on the remaining items
+    stack = [("", cfg, iter(cfg.items()))]
+    while stack:
+        prefix, sub_cfg, items = stack[-1]
+        for key, value in items:
+            true_key = f"{prefix}.{key}" if prefix else key
+
+            # If dict: continue with the new prefix (this level is resumed afterwards)
+            if isinstance(value, dict):
+                stack.append((true_key, value, iter(value.items())))
+                break
+
+            yield true_key, sub_cfg, key, value
+        else:
+            stack.pop()
 
 
 def config_unflatten(cfg: Dict[str, Union[Value, List[Value]]]) -> Config:
@@ -132,22 +162,11 @@ def config_unflatten(cfg: Dict[str, Union[Value, List[Value]]]) -> Config:
         Config: The unflattened config
     """
     unflattened_cfg: Config = {}
+    sub_cfgs: Dict[str, Config] = {}  # Sub configs already reached, by prefix
     for key, value in cfg.items():
-        current_cfg = unflattened_cfg
-
-        keys = key.split(".")
+        prefix, dot, k = key.rpartition(".")
+        current_cfg = _get_sub_config(unflattened_cfg, sub_cfgs, prefix, key) if dot else unflattened_cfg
 
-        for k in keys[:-1]:
-            if k not in current_cfg:
-                current_cfg[k] = {}
-
-            next_cfg = current_cfg[k]
-            if isinstance(next_cfg, dict):
-                current_cfg = next_cfg
-            else:
-                raise ValueError(f"Key {key} is already set. Can't override it (Found a value for {k})")
-
-        k = keys[-1]
         if k in current_cfg:
             raise ValueError(f"Key {key} is already set. Can't override it")
         current_cfg[k] = value
@@ -155,10 +174,37 @@ def config_unflatten(cfg: Dict[str, Union[Value, List[Value]]]) -> Config:
     return unflattened_cfg
 
 
+def _get_sub_config(cfg: Config, sub_cfgs: Dict[str, Config], prefix: str, key: str) -> Config:
+    """Get (or create) the sub config of cfg at the given prefix. Sub configs are cached in sub_cfgs"""
+    if prefix in sub_cfgs:
+        return sub_cfgs[prefix]
+
+    parent_prefix, dot, k = prefix.rpartition(".")
+    current_cfg = _get_sub_config(cfg, sub_cfgs, parent_prefix, key) if dot else cfg
+
+    next_cfg = current_cfg.setdefault(k, {})
+    if not isinstance(next_cfg, dict):
+        raise ValueError(f"Key {key} is already set. Can't override it (Found a value for {k})")
+
+    sub_cfgs[prefix] = next_cfg
+    return next_cfg
+
+
+def _clone(value: Union[Value, List[Value], Config]) -> Union[Value, List[Value], Config]:
+    """Faster deepcopy for configurations (Only dict and list are copied, other values are immutable)"""
+    if isinstance(value, dict):
+        return {key: _clone(sub_value) for key, sub_value in value.items()}
+    if isinstance(value, list):
+        return [_clone(sub_value) for sub_value in value]  # type: ignore
+    return value
+
+
 def merge(cfg_1: Config, cfg_2: Config, new_key_policy="warn") -> Config:
     """Merge cfg_2 into cfg_1.
 
     cfg_1 is not modified. (Nor cfg_2)
+    Nothing is deep copied: only the sub configs modified by the merge are copied,
+    others sub configs and values are shared with cfg_1 and cfg_2.
 
     Args:
         cfg_1 (Config): First configuration
@@ -173,11 +219,9 @@ def merge(cfg_1: Config, cfg_2: Config, new_key_policy="warn") -> Config:
     """
     assert new_key_policy in ["raise", "warn", "pass"]
 
-    cfg = copy.deepcopy(cfg_1)
+    cfg = dict(cfg_1)
 
     for key, value in cfg_2.items():
-        value = copy.deepcopy(value)
-
         if key not in cfg:
             if "__" == key[:2]:  # Allow specific keys to be new
                 cfg[key] = value
@@ -207,6 +251,10 @@ def merge(cfg_1: Config, cfg_2: Config, new_key_policy="warn") -> Config:
     return cfg
 
 
+# Beginning of any string accepted by int or float (Spaces, sign, then digits, inf or nan)
+_NUMBER_REGEXP = re.compile("\\s*[-+]?(\\d|\\.\\d|inf|nan)", re.IGNORECASE)
+
+
 def convert_if_possible(value: str) -> Value:
     """Try to convert the string to another type if possible
 
@@ -219,17 +267,22 @@ def convert_if_possible(value: str) -> Value:
     Returns:
         Value: Converted value
     """
-    try:
-        return int(value)
-    except ValueError:
+    # Cheap check first, to skip int/float (and their exceptions) for most of the strings
+    if _NUMBER_REGEXP.match(value):
         try:
-            return float(value)
+            return int(value)
         except ValueError:
-            if value.lower() == "false":
-                return False
-            if value.lower() == "true":
-                return True
-            return value
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    lowered = value.lower()
+    if lowered == "false":
+        return False
+    if lowered == "true":
+        return True
+    return value
 
 
 class Parser:
@@ -237,27 +290,35 @@ class Parser:
 
     Attrs:
         NO_PARSE_STRING (str): Add this string to the begining of the value to prevent parsing
-        ENV_VAR_REGEXP, ENV_VAR_REGEXP_BRACKET (str): Regexp for environement variables matching
+        ENV_VAR_REGEXP, ENV_VAR_REGEXP_BRACKET (re.Pattern): Regexp for environement variables matching
             A bit too simple, but will do the job
-        SELF_REF_REGEXP (str): Regexp for self references. A bit permissive, but fine.
+        SELF_REF_REGEXP (re.Pattern): Regexp for self references. A bit permissive, but fine.
+            (Regexps are compiled once at class creation)
+        REFERENCE_REGEXP (re.Pattern): Union of the three regexps above, so that a value is scanned only once.
+            The group that matched (1: ${ENV}, 2: $ENV, 3: {self.ref}) is given by `match.lastindex`.
     """
 
     NO_PARSE_STRING = "!P"
-    ENV_VAR_REGEXP = "\\$([a-zA-Z][a-zA-Z1-9_]*)"
-    ENV_VAR_REGEXP_BRACKET = "\\$\\{([a-zA-Z][a-zA-Z1-9_]*)\\}"
-    SELF_REF_REGEXP = "\\{([a-zA-Z1-9_.]+)\\}"
+    ENV_VAR_REGEXP = re.compile("\\$([a-zA-Z][a-zA-Z1-9_]*)")
+    ENV_VAR_REGEXP_BRACKET = re.compile("\\$\\{([a-zA-Z][a-zA-Z1-9_]*)\\}")
+    SELF_REF_REGEXP = re.compile("\\{([a-zA-Z1-9_.]+)\\}")
+    REFERENCE_REGEXP = re.compile(
+        f"{ENV_VAR_REGEXP_BRACKET.pattern}|{ENV_VAR_REGEXP.pattern}|{SELF_REF_REGEXP.pattern}"
+    )
 
     def __init__(self, config: Config) -> None:
-        self.config = config_flatten(config)
+        self.config = cast(Config, _clone(config))  # Parsed inplace
         self.parsing: Set[str] = set()
         self.parsed: Set[str] = set()
+        self.env_cache: Dict[str, Union[Value, List[Value]]] = {}  # Values with only env references
+        self.resolved: Dict[str, Optional[Tuple[Config, str]]] = {}  # Location of parsed references
 
     def parse(self) -> Config:
         """Parse each key/value of the configuration"""
-        for key in self.config:  # Flatten, there is only one level
-            self.parse_key(key)
+        for key, sub_cfg, sub_key, _ in _iter_values(self.config):
+            self._parse_value(key, sub_cfg, sub_key)
 
-        return config_unflatten(self.config)
+        return self.config
 
     def parse_key(self, key: str):
         """Parse a single key/value of the configuration
@@ -267,6 +328,46 @@ class Parser:
         Args:
             key (str): Key of the value to parse
         """
+        if self._resolve(key) is None:
+            raise KeyError(f"No value for key {key}")
+
+    def locate(self, key: str) -> Optional[Tuple[Config, str]]:
+        """Find where the value of a key is stored in the configuration
+
+        Args:
+            key (str): Key of the value ("." separated)
+
+        Returns:
+            Optional[Tuple[Config, str]]: The sub config holding the value and the key of the value inside it.
+                None if there is no value (not a dict) for this key.
+        """
+        sub_cfg = self.config
+        *path, sub_key = key.split(".")
+        for k in path:
+            next_cfg = sub_cfg.get(k)
+            if not isinstance(next_cfg, dict):
+                return None
+            sub_cfg = next_cfg
+
+        if sub_key not in sub_cfg or isinstance(sub_cfg[sub_key], dict):
+            return None
+
+        return sub_cfg, sub_key
+
+    def _resolve(self, key: str) -> Optional[Tuple[Config, str]]:
+        """Locate and parse the value of a key (See `locate`). Memoized for keys referenced several times"""
+        if key in self.resolved:
+            return self.resolved[key]
+
+        location = self.locate(key)
+        if location is not None:
+            self._parse_value(key, *location)
+
+        self.resolved[key] = location
+        return location
+
+    def _parse_value(self, key: str, sub_cfg: Config, sub_key: str) -> None:
+        """Parse the value of key, stored in sub_cfg[sub_key]"""
         if key in self.parsed:
             return
 
@@ -274,7 +375,7 @@ class Parser:
             raise RuntimeError(f"Cyclic references in configuration: Unable to resolve {key}")
 
         self.parsing.add(key)
-        self.config[key] = self.format(self.config[key])
+        sub_cfg[sub_key] = self.format(cast(Union[Value, List[Value]], sub_cfg[sub_key]))
 
         self.parsing.remove(key)
         self.parsed.add(key)
@@ -288,73 +389,76 @@ class Parser:
         Returns:
             Union[Value, List[Value]]: Parsed value
         """
-        if isinstance(value, list):
-            return list(map(self.format, value))  # type: ignore
-
-        if not isinstance(value, str):  # Only strings can be parsed
+        if not isinstance(value, str):  # Only strings can be parsed (and lists of strings)
+            if isinstance(value, list):
+                return [self.format(sub_value) for sub_value in value]  # type: ignore
             return value
 
         # Allow a simple directive to prevent parsing
         if self.NO_PARSE_STRING == value[: len(self.NO_PARSE_STRING)]:
             return value[len(self.NO_PARSE_STRING) :]
 
-        # SKip as much as possible parsing as I coded it badly
-        if "$" in value:
-            value = self.replace_env_reference(value)
-            if not isinstance(value, str):
-                return value
-
-        if "{" in value:
-            value = self.replace_self_reference(value)
-
-        return value
-
-    def replace_env_reference(self, value: str) -> Union[Value, List[Value]]:
-        """Solve environment variables references for the given value
-
-        Args:
-            value (str): String to parse
+        # Without self references, the result only depends on the string: parse it once
+        if "{" not in value:
+            if "$" in value and value not in self.env_cache:
+                self.env_cache[value] = self.replace_references(value)
+            return self.env_cache.get(value, value)  # Nothing to resolve without "$"
 
-        Returns
-            Union[Value, List[Value]]: Parsed value (converted if possible)
-        """
+        # Handle full match differently to cast to the right value
+        match = self.SELF_REF_REGEXP.fullmatch(value)
+        if match:
+            location = self._resolve(match.group(1))
+            if location is not None:
+                sub_cfg, sub_key = location
+                return cast(Union[Value, List[Value]], _clone(sub_cfg[sub_key]))  # Keep type if full match
 
-        def env_replace(match):
-            env_key = match.group(1)
-            if env_key in os.environ:
-                return os.environ[env_key]
-            warnings.warn(f"Environment variable {env_key} not define")
-            return ""
+        return self.replace_references(value)
 
-        value = re.sub(self.ENV_VAR_REGEXP, env_replace, value)
-        value = re.sub(self.ENV_VAR_REGEXP_BRACKET, env_replace, value)
-        return convert_if_possible(value)
+    def replace_references(self, value: str) -> Union[Value, List[Value]]:
+        """Solve environment variables and configuration references for the given value
 
-    def replace_self_reference(self, value: str) -> Union[Value, List[Value]]:
-        """Solve configuration references for the given value
+        All the references are substituted in a single scan of the string.
 
         Args:
             value (str): String to parse
 
         Returns
-            Union[Value, List[Value]]: Parsed value (converted if total match)
+            Union[Value, List[Value]]: Parsed value
+                (converted if possible when there are only environment variables references)
         """
-
-        def self_replace(match):
-            key = match.group(1)
-            if key in self.config:
-                self.parse_key(key)
-                return str(self.config[key])
-            warnings.warn(f"Unable to resolve reference {key}.")
+        found_env_ref = False
+        found_self_ref = False
+        missing_env: List[str] = []  # Warnings are emitted once per value
+        missing_refs: List[str] = []
+        environ = os.environ
+
+        def replace(match):
+            nonlocal found_env_ref, found_self_ref
+
+            key = match.group(match.lastindex)
+            if match.lastindex == 3:  # Self reference
+                found_self_ref = True
+                location = self._resolve(key)
+                if location is not None:
+                    sub_cfg, sub_key = location
+                    return str(sub_cfg[sub_key])
+                missing_refs.append(key)
+                return ""
+
+            found_env_ref = True
+            env_value = environ.get(key)
+            if env_value is not None:
+                return env_value
+            missing_env.append(key)
             return ""
 
-        # Handle full match differently to cast to the right value
-        match = re.fullmatch(self.SELF_REF_REGEXP, value)
-        if match:
-            key = match.group(1)
-            if key in self.config:
-                self.parse_key(key)
-                return copy.deepcopy(self.config[key])  # Keep type if full match
+        value = self.REFERENCE_REGEXP.sub(replace, value)
+
+        if missing_env:
+            warnings.warn(f"Environment variable(s) not defined: {', '.join(missing_env)}")
+        if missing_refs:
+            warnings.warn(f"Unable to resolve reference(s): {', '.join(missing_refs)}")
 
-        value = re.sub(self.SELF_REF_REGEXP, self_replace, value)
+        if found_env_ref and not found_self_ref:
+            return convert_if_possible(value)
         return value
@@ -11,7 +11,7 @@ When an experiment is launched:
     a- The built configuration file (with resolved dependencies): config.yml
     b- The built configuration file but unparsed: raw_config.yml
     c- Frozen requirements: frozen_requirements.txt
-    d- Copy of all the code in the package of the main function
+    d- Copy of all the code in the package of the main function (Hidden directories and caches are skipped)
 4- The output directory is registered as the current directory and is set in sys.path.
    You can therefore write directly in the current directory in the main function.
 5- Finally the main function is loaded and run.
@@ -22,18 +22,22 @@ directory
 
 import argparse
 import atexit
+import concurrent.futures
 import importlib
 import os
 import pathlib
-import subprocess
+import shutil
 import sys
-from typing import Dict, cast, List, TextIO, Union
+from typing import Callable, Dict, cast, List, TextIO, Union
 import warnings
 
 from . import config
 
 
 CODE_FILES_EXTENSIONS = [".py"]
+FREEZE_EXCLUDED_PACKAGES = ["pip", "setuptools", "wheel", "distribute"]  # Same as pip freeze
+LOG_BUFFER_SIZE = 1 << 17  # 128KiB buffer for outputs.log (Flushed on stdout/stderr flush and at exit)
+IGNORED_DIRECTORIES = ["__pycache__", "node_modules"]  # Hidden directories (.git, .venv, ...) are also ignored
 
 
 class StdMultiplexer:
@@ -43,16 +47,19 @@ class StdMultiplexer:
     It will therefore have the same properties as the main stream.
     """
 
+    __slots__ = ("main_stream", "ios", "_writes")  # Fast attribute access on the write path (No instance dict)
+
     def __init__(self, main_stream: TextIO, ios: List[TextIO]):
         self.main_stream = main_stream
         self.ios = ios
+        self._writes = [io_.write for io_ in ios]  # Bound once, write is called for each print
 
     def write(self, string: str) -> int:
         """Write to all the streams"""
         ret = self.main_stream.write(string)
 
-        for io_ in self.ios:
-            io_.write(string)
+        for write in self._writes:
+            write(string)
 
         return ret
 
@@ -75,7 +82,7 @@ class StdFileRedirection:
     """
 
     def __init__(self, path: Union[pathlib.Path, str]) -> None:
-        self.file = open(path, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        self.file = open(path, "w", buffering=LOG_BUFFER_SIZE, encoding="utf-8")  # pylint: disable=consider-using-with
         self.stdout = StdMultiplexer(sys.stdout, [self.file])
         self.stderr = StdMultiplexer(sys.stderr, [self.file])
         sys.stdout = self.stdout  # type: ignore
@@ -89,6 +96,9 @@ class StdFileRedirection:
         self.file.close()
 
 
+Converter = Callable[[str], Union[config.Value, List[config.Value]]]
+
+
 def convert_as(default: Union[config.Value, List[config.Value]], arg: str) -> Union[config.Value, List[config.Value]]:
     """Convert the argument to the same type found in the config
 
@@ -99,30 +109,61 @@ def convert_as(default: Union[config.Value, List[config.Value]], arg: str) -> Un
     Returns:
         Union[Value, List[Value]]: The converted value
     """
+    return make_converter(default)(arg)
+
+
+def _convert_bool(arg: str) -> bool:
+    if arg.lower() in {"false", "0"}:
+        return False
+    if arg.lower() in {"true", "1"}:
+        return True
+    raise ValueError(f"Unable to convert to boolean: {arg}")
+
+
+# Converters by type of the default value (Looked up first with the exact type)
+_CONVERTERS: Dict[type, Converter] = {
+    bool: _convert_bool,
+    int: int,
+    float: float,
+    str: str,  # Keep the argument as it is
+    type(None): config.convert_if_possible,
+}
+
+
+def make_converter(default: Union[config.Value, List[config.Value]]) -> Converter:
+    """Build the function that converts arguments to the same type as `default` (See `convert_as`)
+
+    The type dispatch is done once, the converter can then be applied directly to any argument.
+
+    Args:
+        default (Union[Value, List[Value]]): Default value in the config file
+
+    Returns:
+        Callable[[str], Union[Value, List[Value]]]: The converter
+    """
+    converter = _CONVERTERS.get(type(default))
+    if converter is not None:
+        return converter
+
     if isinstance(default, list):
-        values = arg.split(",")
-        if len(values) != len(default):
-            if len(default) > 0:
-                return [cast(config.Value, convert_as(default[0], value)) for value in values]
-            return [config.convert_if_possible(value) for value in values]
-        return [cast(config.Value, convert_as(default[j], value)) for j, value in enumerate(values)]
-
-    if isinstance(default, bool):
-        if arg.lower() in {"false", "0"}:
-            return False
-        if arg.lower() in {"true", "1"}:
-            return True
-        raise ValueError(f"Unable to convert to boolean: {arg}")
-
-    converted: config.Value = arg
-    if isinstance(default, int):
-        converted = int(arg)
-    elif isinstance(default, float):
-        converted = float(arg)
-    elif default is None:
-        converted = config.convert_if_possible(arg)
-
-    return converted
+        converters = [cast(Callable[[str], config.Value], make_converter(value)) for value in default]
+
+        def convert_list(arg: str) -> List[config.Value]:
+            values = arg.split(",")
+            if len(values) != len(converters):
+                if len(converters) > 0:
+                    return list(map(converters[0], values))
+                return list(map(config.convert_if_possible, values))
+            return [convert(value) for convert, value in zip(converters, values)]
+
+        return convert_list
+
+    # Instances of subclasses (bool is checked before int)
+    for type_, converter in _CONVERTERS.items():
+        if isinstance(default, type_):
+            return converter
+
+    return str  # Keep the argument as it is
 
 
 def build_config(config_file: str, args: List[str]) -> config.Config:
@@ -132,7 +173,7 @@ def build_config(config_file: str, args: List[str]) -> config.Config:
         config_file (str): path to configuration file
         args (List[str]): List of additional args
             Expected format: [--my.entire.key, value, --my.other.key, other_value, ...]
-            This feature support only simple types (converted with `convert_as`)
+            This feature support only simple types (converted with `make_converter`)
 
     Returns:
         Config: The config for this run
@@ -143,38 +184,59 @@ def build_config(config_file: str, args: List[str]) -> config.Config:
     # Parse args to build a cfg
     assert len(args) % 2 == 0, "Args should be even, missing a value or a key"
 
+    converters: Dict[str, Converter] = {}  # Built once per overridden key
     key = ""
     for i, arg in enumerate(args):
         if i % 2 == 0:
             assert arg[:2] == "--", "Expected key format: --my.entire.key"
-            key = arg[2:]
+            key = sys.intern(arg[2:])  # Same object as the flattened key
             continue
 
         if key not in flatten:
             raise KeyError(f"Unexpected key when merging args: {key}")
 
-        flatten[key] = convert_as(flatten[key], arg)
+        if key not in converters:
+            converters[key] = make_converter(flatten[key])
+        flatten[key] = converters[key](arg)
 
     return config.config_unflatten(flatten)
 
 
 def _code_copy(src_path: pathlib.Path, dest_path: pathlib.Path) -> None:
-    """Probably inefficient folder search but do the job"""
+    """Copy src_path into dest_path, keeping only code files
+
+    The tree is walked iteratively with os.scandir, which caches the type of each entry.
+    """
     dest_path = dest_path / src_path.name
     if dest_path.exists():
         raise RuntimeError("Copying files into an existing location...")
 
     if src_path.is_file():
         if src_path.suffix in CODE_FILES_EXTENSIONS:
-            dest_path.write_bytes(src_path.read_bytes())
+            shutil.copyfile(src_path, dest_path)
         return
 
     if not src_path.is_dir():
         warnings.warn(f"Unhandled path in code duplication: {src_path}")
+        return
 
     dest_path.mkdir()  # Can create empty dir, but fine
-    for child_path in src_path.iterdir():
-        _code_copy(child_path, dest_path)
+    stack = [(str(src_path), str(dest_path))]
+    while stack:
+        src_dir, dest_dir = stack.pop()
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                dest = os.path.join(dest_dir, entry.name)
+                if entry.is_file():
+                    if os.path.splitext(entry.name)[1] in CODE_FILES_EXTENSIONS:
+                        shutil.copyfile(entry.path, dest)
+                elif entry.is_dir():
+                    if entry.name in IGNORED_DIRECTORIES or entry.name[0] == ".":
+                        continue
+                    os.mkdir(dest)
+                    stack.append((entry.path, dest))
+                else:
+                    warnings.warn(f"Unhandled path in code duplication: {entry.path}")
 
 
 def duplicate_code(code_dir: pathlib.Path, output_dir: pathlib.Path, module_name: str) -> None:
@@ -185,16 +247,69 @@ def duplicate_code(code_dir: pathlib.Path, output_dir: pathlib.Path, module_name
         output_dir (Path): Path to where copy the code
         module_name (str): Name of the main module to run
     """
-    package_path = code_dir / module_name.split(".", maxsplit=1)[0]
-    _code_copy(package_path, output_dir)
+    package_name = module_name.split(".", maxsplit=1)[0]
+
+    # Check the name before copying anything: it should not point outside code_dir (absolute path, "..", ...)
+    if not package_name.isidentifier():
+        raise ValueError(f"Invalid module name: '{module_name}'. Expected format: package.module")
+
+    _code_copy(code_dir / package_name, output_dir)
 
 
 def save_requirements(output_dir: pathlib.Path) -> None:
+    """Save the installed distributions (name==version, as pip freeze) into a requirements.txt
+
+    Distributions are read with importlib.metadata, which is much faster than running pip freeze.
+    (Importing pip is not an option either, it blocks setuptools: https://github.com/pypa/setuptools/issues/3044)
+
+    If a distribution has been installed from a direct url (editable install, vcs, local path),
+    its version is not enough to reproduce it: pip freeze is used instead.
+    """
+    from importlib import metadata  # pylint: disable=import-outside-toplevel  # Slow import, only needed here
+
+    requirements: Dict[str, str] = {}
+    for dist in metadata.distributions():
+        name = dist.metadata["Name"]
+        if not name or name.lower() in FREEZE_EXCLUDED_PACKAGES:
+            continue
+        if name.lower() not in requirements:  # First one found in sys.path is the one used
+            if dist.read_text("direct_url.json") is not None:
+                _pip_freeze(output_dir)
+                return
+            requirements[name.lower()] = f"{name}=={dist.version}"
+
+    (output_dir / "requirements.txt").write_text(
+        "".join(f"{requirements[key]}\n" for key in sorted(requirements)), encoding="utf-8"
+    )
+
+
+def _pip_freeze(output_dir: pathlib.Path) -> None:
     """Save the requirements using pip freeze into a requirements.txt"""
-    subprocess.run("pip freeze > requirements.txt", check=False, cwd=output_dir, shell=True)
-    # OLD: Importing pip blocks setuptools (cf : https://github.com/pypa/setuptools/issues/3044)
-    # from pip._internal.operations import freeze
-    # (output_dir / "requirements.txt").write_text("\n".join(freeze.freeze()), encoding="utf-8")
+    import subprocess  # pylint: disable=import-outside-toplevel  # Rarely needed
+
+    with open(output_dir / "requirements.txt", "w", encoding="utf-8") as file:
+        subprocess.run([sys.executable, "-m", "pip", "freeze"], check=False, stdout=file)
+
+
+def _create_experiment_dir(parent: pathlib.Path) -> pathlib.Path:
+    """Create the next experiment directory (exp.{i}) inside parent
+
+    The parent directory is listed once, and the index following the largest existing one is used.
+    If another run creates the same directory concurrently, the next index is tried.
+    """
+    i = 0
+    if parent.is_dir():
+        with os.scandir(parent) as entries:
+            for entry in entries:
+                if entry.name[:4] == "exp." and entry.name[4:].isdecimal():
+                    i = max(i, int(entry.name[4:]) + 1)
+
+    while True:
+        try:
+            os.makedirs(parent / f"exp.{i}", exist_ok=False)
+            return parent / f"exp.{i}"
+        except FileExistsError:
+            i += 1
 
 
 def main(cfg: config.Config, debug: bool):
@@ -211,41 +326,41 @@ def main(cfg: config.Config, debug: bool):
     cfg = config.Parser(cfg).parse()  # Resolve self and env references
 
     # Load the run data
-    module_name, func_name = cast(Dict[str, str], cfg["__run__"])["__main__"].split(":")
-    experiment_name = cast(Dict[str, str], cfg["__run__"])["__name__"]
-    output_dir = pathlib.Path(cast(Dict[str, str], cfg["__run__"])["__output_dir__"])
-    code_dir = pathlib.Path(cast(Dict[str, str], cfg["__run__"]).get("__code__", os.getcwd()))
+    run_cfg = cast(Dict[str, str], cfg["__run__"])
+    raw_run_cfg = cast(Dict[str, str], raw_cfg["__run__"])
+    module_name, func_name = run_cfg["__main__"].split(":")
+    experiment_name = run_cfg["__name__"]
+    output_dir = pathlib.Path(run_cfg["__output_dir__"])
+    code_dir = pathlib.Path(run_cfg.get("__code__", os.getcwd()))
 
     # Set output_dir as an absolute path
     output_dir = output_dir.absolute()
-    cast(Dict[str, str], raw_cfg["__run__"])["__output_dir__"] = str(output_dir)
-    cast(Dict[str, str], cfg["__run__"])["__output_dir__"] = str(output_dir)
+    raw_run_cfg["__output_dir__"] = str(output_dir)
+    run_cfg["__output_dir__"] = str(output_dir)
 
-    # Compute true output dir
+    # Compute and create the true output dir
     if debug:
-        output_dir = output_dir / "DEBUG" / experiment_name / "exp.0"
+        output_dir = _create_experiment_dir(output_dir / "DEBUG" / experiment_name)
     else:
-        output_dir = output_dir / experiment_name / "exp.0"
-
-    i = 0
-    while output_dir.exists():
-        i += 1
-        output_dir = output_dir.with_suffix(f".{i}")
-
-    # Create the true output dir and fill it
-    os.makedirs(output_dir, exist_ok=False)
-
-    if debug:  # In debug mode, do not copy the code nor the requirements
-        sys.path.insert(0, str(code_dir))
-    else:
-        save_requirements(output_dir)
-        duplicate_code(code_dir, output_dir, module_name)
-        cast(Dict[str, str], raw_cfg["__run__"])["__code__"] = str(output_dir)
-        cast(Dict[str, str], cfg["__run__"])["__code__"] = str(output_dir)
-        sys.path.insert(0, str(output_dir))
-
-    config.save_config(cfg, output_dir / "config.yml")
-    config.save_config(raw_cfg, output_dir / "raw_config.yml")
+        output_dir = _create_experiment_dir(output_dir / experiment_name)
+
+    # Fill the output dir. Saving the requirements is independent from the rest and mostly IO: run it in the background
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        requirements = None
+        if debug:  # In debug mode, do not copy the code nor the requirements
+            sys.path.insert(0, str(code_dir))
+        else:
+            requirements = executor.submit(save_requirements, output_dir)
+            duplicate_code(code_dir, output_dir, module_name)
+            raw_run_cfg["__code__"] = str(output_dir)
+            run_cfg["__code__"] = str(output_dir)
+            sys.path.insert(0, str(output_dir))
+
+        config.save_config(cfg, output_dir / "config.yml")
+        config.save_config(raw_cfg, output_dir / "raw_config.yml")
+
+        if requirements is not None:
+            requirements.result()  # Wait and raise errors if any
 
     # Execute inside output_dir
     os.chdir(output_dir)
@@ -281,8 +396,7 @@ def entry_point() -> None:
     args = parser.parse_args()
     # Hacky counter to the behavior of argparse. Just don't use debug as a config key
     # if --debug is specified after the config file, it will end up with additionnal args...
-    if not args.debug and "--debug" in args.args:
-        args.args.remove("--debug")
-        args.debug = True
+    remaining_args = [arg for arg in args.args if arg != "--debug"]
+    debug = args.debug or len(remaining_args) != len(args.args)
 
-    main(build_config(args.config, args.args), args.debug)
+    main(build_config(args.config, remaining_args), debug)